@@ -0,0 +1,21 @@
+-- 002_strava_stream_arrays.sql
+-- Native arrays for fixed-type Strava streams (raw JSONB stays as the archive)
+--
+-- The ingester writes these columns unconditionally: apply this migration to
+-- existing databases BEFORE deploying it. aura_strava.activity_streams is not
+-- created by any migration here, so on a fresh initdb run this file is a no-op
+-- (ALTER TABLE IF EXISTS) and has to be re-run once the table exists.
+--
+-- Streams with a typed column no longer get a JSONB copy in `data` (it is left
+-- NULL; read the typed column or raw->'data'), so `data` must be nullable.
+
+BEGIN;
+
+ALTER TABLE IF EXISTS aura_strava.activity_streams
+  ADD COLUMN IF NOT EXISTS data_int     INTEGER[],           -- time, heartrate, cadence, watts, temp
+  ADD COLUMN IF NOT EXISTS data_float   REAL[],              -- distance, velocity_smooth, altitude, grade_smooth
+  ADD COLUMN IF NOT EXISTS data_bool    BOOLEAN[],           -- moving
+  ADD COLUMN IF NOT EXISTS data_latlng  DOUBLE PRECISION[],  -- latlng, N x 2 (lat, lng)
+  ALTER COLUMN data DROP NOT NULL;
+
+COMMIT;
@@ -1,10 +1,14 @@
 import os
 import time
-import json
-import requests
+import asyncio
+from collections.abc import Mapping
 from datetime import datetime, timedelta, timezone
+from typing import Any, Optional
 
+import aiohttp
+import orjson
 import psycopg
+from psycopg.types.json import Jsonb, set_json_dumps
 from dotenv import load_dotenv
 
 
@@ -42,14 +46,33 @@ STREAM_KEYS = "time,heartrate,cadence,watts,velocity_smooth,altitude,grade_smoot
 LOOKBACK_BUFFER_HOURS = 6
 DEFAULT_DAYS_IF_EMPTY = 30
 PER_PAGE = 200
-SLEEP_BETWEEN_CALLS_S = 0.2
 COMMIT_EVERY_N_ACTIVITIES = 25
 MAX_ACTIVITIES_PER_RUN = None
 
+# HTTP concurrency / rate limiting
+MAX_CONCURRENT_REQUESTS = 8
+HTTP_TIMEOUT_S = 30
+RATE_LIMIT_WINDOW_S = 15 * 60
+RATE_LIMIT_HEADROOM = 0.9
+MAX_BACKOFF_S = 60
+MAX_ATTEMPTS = 6
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+# Overall quota, and the (lower) quota for read requests; every call here is a GET
+RATE_LIMIT_HEADER_PREFIXES = ("X-RateLimit", "X-ReadRateLimit")
+
+# Strava payloads are plain JSON objects. The hot path is fully annotated so the
+# module can be compiled with mypyc (`mypyc strava_ingest_recent.py`) if needed.
+Activity = dict[str, Any]
+StreamRow = tuple[int, str, Optional[int], Jsonb]
+
+NO_LATLNG = (None, None)
+
 REQUIRED_STREAMS_RUN = {
     "time", "heartrate", "velocity_smooth", "altitude",
     "grade_smooth", "latlng", "distance", "moving"
 }
+# Keep it cheap for non-runs; you can expand later if you want
+REQUIRED_STREAMS_OTHER = {"time"}
 
 
 def utc_now() -> datetime:
@@ -87,10 +110,10 @@ def update_env_key(env_path: str, key: str, value: str) -> None:
     os.replace(tmp, env_path)
 
 
-def refresh_access_token() -> str:
+async def refresh_access_token(session: aiohttp.ClientSession) -> str:
     global STRAVA_REFRESH_TOKEN
 
-    r = requests.post(
+    async with session.post(
         TOKEN_URL,
         data={
             "client_id": STRAVA_CLIENT_ID,
@@ -98,13 +121,12 @@ def refresh_access_token() -> str:
             "grant_type": "refresh_token",
             "refresh_token": STRAVA_REFRESH_TOKEN,
         },
-        timeout=30,
-    )
-    print("[Token refresh] HTTP", r.status_code)
-    if r.status_code != 200:
-        raise RuntimeError(f"Token refresh failed: {r.text}")
+    ) as r:
+        print("[Token refresh] HTTP", r.status)
+        if r.status != 200:
+            raise RuntimeError(f"Token refresh failed: {await r.text()}")
 
-    data = r.json()
+        data = orjson.loads(await r.read())
 
     token = data.get("access_token")
     if not token:
@@ -119,44 +141,167 @@ def refresh_access_token() -> str:
     return token
 
 
-def fetch_activities(access_token: str, after_epoch: int):
+def seconds_until_next_window() -> float:
+    """
+    Strava's short-term quota resets on the quarter hour (:00, :15, :30, :45).
+    """
+    return RATE_LIMIT_WINDOW_S - (time.time() % RATE_LIMIT_WINDOW_S)
+
+
+def quota_fraction(quota: tuple[int, int]) -> float:
+    limit, used = quota
+    return used / limit if limit > 0 else float("inf")
+
+
+class RateLimiter:
+    """
+    Tracks Strava's quota from the X-RateLimit-* and X-ReadRateLimit-* Limit /
+    Usage headers ("short,daily" pairs) and counts requests sent since the last
+    response. For each window it follows whichever quota is closer to its limit,
+    since our GETs count against both.
+
+    Callers run freely until the 15-min usage crosses RATE_LIMIT_HEADROOM of the
+    limit, then wait for the window to reset. The daily quota gets no headroom:
+    we spend all of it and let the 429 that follows stop the run (see strava_get).
+    """
+
+    def __init__(self, headroom: float = RATE_LIMIT_HEADROOM) -> None:
+        self.headroom = headroom
+        self.limit_short: Optional[int] = None
+        self.limit_daily: Optional[int] = None
+        self.used_short = 0
+        self.used_daily = 0
+        self._lock = asyncio.Lock()
+
+    def update(self, headers: Mapping[str, str]) -> None:
+        short: list[tuple[int, int]] = []  # (limit, used) per quota
+        daily: list[tuple[int, int]] = []
+        for prefix in RATE_LIMIT_HEADER_PREFIXES:
+            limit = headers.get(f"{prefix}-Limit")
+            usage = headers.get(f"{prefix}-Usage")
+            if not limit or not usage:
+                continue
+
+            try:
+                limit_short, limit_daily = [int(x) for x in limit.split(",")]
+                used_short, used_daily = [int(x) for x in usage.split(",")]
+            except ValueError:
+                continue
+
+            short.append((limit_short, used_short))
+            daily.append((limit_daily, used_daily))
+
+        if not short:
+            return
+
+        self.limit_short, self.used_short = max(short, key=quota_fraction)
+        self.limit_daily, self.used_daily = max(daily, key=quota_fraction)
+
+    async def acquire(self) -> None:
+        async with self._lock:
+            if self.limit_short and self.used_short >= self.limit_short * self.headroom:
+                delay = seconds_until_next_window()
+                print(
+                    f"⏳ Strava usage {self.used_short}/{self.limit_short}. "
+                    f"Sleeping {delay:.0f}s until the next 15-min window…"
+                )
+                await asyncio.sleep(delay)
+                self.used_short = 0
+
+            self.used_short += 1
+            self.used_daily += 1
+
+    def daily_exhausted(self) -> bool:
+        return self.limit_daily is not None and self.used_daily >= self.limit_daily
+
+
+async def strava_get(
+    session: aiohttp.ClientSession,
+    limiter: RateLimiter,
+    access_token: str,
+    url: str,
+    params: dict[str, Any],
+) -> tuple[int, Any]:
+    """
+    GET a Strava API url, retrying 429, transient 5xx responses and connection /
+    timeout errors up to MAX_ATTEMPTS times. Waits for Retry-After when the server
+    sends one; otherwise a 429 waits for the next 15-min window (unless the daily
+    quota is spent, which is returned at once) and everything else backs off
+    exponentially.
+    Returns (status, body) where body is decoded JSON on 200 and text otherwise;
+    once retries run out the last error response is returned for the caller to
+    raise (or the last connection error is re-raised).
+    """
     headers = {"Authorization": f"Bearer {access_token}"}
-    page = 1
-    fetched = 0
-
-    while True:
-        r = requests.get(
-            ACTIVITIES_URL,
-            headers=headers,
-            params={"after": after_epoch, "page": page, "per_page": PER_PAGE},
-            timeout=30,
-        )
-
-        if r.status_code == 429:
-            print("⏳ Rate limited (429). Sleeping 60s…")
-            time.sleep(60)
+    delay: float
+    for attempt in range(MAX_ATTEMPTS):
+        await limiter.acquire()
+        try:
+            async with session.get(url, headers=headers, params=params) as r:
+                limiter.update(r.headers)
+                if r.status == 200:
+                    return r.status, orjson.loads(await r.read())
+                body = await r.text()
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            if attempt == MAX_ATTEMPTS - 1:
+                raise
+            delay = min(MAX_BACKOFF_S, 2 ** attempt)
+            print(f"⏳ {type(e).__name__} talking to Strava. Retrying in {delay:.0f}s…")
+            await asyncio.sleep(delay)
             continue
 
-        if r.status_code != 200:
-            raise RuntimeError(f"Activities fetch failed (HTTP {r.status_code}): {r.text}")
-
-        items = r.json()
-        if not items:
+        if r.status not in RETRY_STATUSES:
+            return r.status, body
+        if r.status == 429 and limiter.daily_exhausted():
+            # Daily quota resets at midnight UTC; no point waiting that out in-process
+            return r.status, body
+        if attempt == MAX_ATTEMPTS - 1:
             break
 
-        for a in items:
-            yield a
-            fetched += 1
-            if MAX_ACTIVITIES_PER_RUN and fetched >= MAX_ACTIVITIES_PER_RUN:
-                return
+        retry_after = r.headers.get("Retry-After")
+        if retry_after and retry_after.isdigit():
+            delay = float(retry_after)
+        elif r.status == 429:
+            delay = seconds_until_next_window()
+        else:
+            delay = min(MAX_BACKOFF_S, 2 ** attempt)
+        print(f"⏳ HTTP {r.status} from Strava. Retrying in {delay:.0f}s…")
+        await asyncio.sleep(delay)
+
+    return r.status, body
+
+
+async def fetch_activities(
+    session: aiohttp.ClientSession,
+    limiter: RateLimiter,
+    access_token: str,
+    after_epoch: int,
+    page: int,
+) -> list[Activity]:
+    """
+    One page of activities started after after_epoch; empty once we run past the end.
+    """
+    status, items = await strava_get(
+        session,
+        limiter,
+        access_token,
+        ACTIVITIES_URL,
+        {"after": after_epoch, "page": page, "per_page": PER_PAGE},
+    )
 
-        page += 1
-        time.sleep(SLEEP_BETWEEN_CALLS_S)
+    if status != 200:
+        raise RuntimeError(f"Activities fetch failed (HTTP {status}): {items}")
 
+    return items
 
-def fetch_streams(access_token: str, activity_id: int) -> dict:
+
+async def fetch_streams(
+    session: aiohttp.ClientSession,
+    limiter: RateLimiter,
+    access_token: str,
+    activity_id: int,
+) -> dict[str, Any]:
     url = f"https://www.strava.com/api/v3/activities/{activity_id}/streams"
-    headers = {"Authorization": f"Bearer {access_token}"}
     params = {
         "keys": STREAM_KEYS,
         "key_by_type": "true",
@@ -164,162 +309,343 @@ def fetch_streams(access_token: str, activity_id: int) -> dict:
         "series_type": "time",
     }
 
-    r = requests.get(url, headers=headers, params=params, timeout=30)
+    status, body = await strava_get(session, limiter, access_token, url, params)
 
-    if r.status_code in (403, 404):
+    if status in (403, 404):
         return {}
 
-    if r.status_code == 429:
-        print("⏳ Rate limited (429) on streams. Sleeping 60s…")
-        time.sleep(60)
-        return fetch_streams(access_token, activity_id)
+    if status != 200:
+        raise RuntimeError(f"Streams fetch failed (HTTP {status}): {body}")
+
+    return body
+
+
+def db_latest_activity_start(cur: psycopg.Cursor) -> Optional[datetime]:
+    cur.execute("SELECT MAX(start_date_utc) FROM aura_strava.activities;")
+    row = cur.fetchone()
+    assert row is not None  # an aggregate always returns one row
+    return row[0]
+
+
+def db_completed_activity_ids(cur: psycopg.Cursor, after_dt: datetime) -> set[int]:
+    """
+    Activities started at/after after_dt that already have every required stream:
+    REQUIRED_STREAMS_RUN when the stored sport_type is 'run' (case-insensitive),
+    REQUIRED_STREAMS_OTHER otherwise. One query for the whole fetch window; the
+    loop skips these before any upsert or streams call.
+    """
+    cur.execute(
+        """
+        SELECT a.activity_id
+        FROM aura_strava.activities a
+        WHERE a.start_date_utc >= %(after)s
+          AND NOT EXISTS (
+            SELECT 1
+            FROM unnest(
+              CASE WHEN lower(a.sport_type) = 'run' THEN %(run)s::text[] ELSE %(other)s::text[] END
+            ) AS r(stream_type)
+            WHERE NOT EXISTS (
+              SELECT 1
+              FROM aura_strava.activity_streams s
+              WHERE s.activity_id = a.activity_id AND s.stream_type = r.stream_type
+            )
+          );
+        """,
+        {
+            "after": after_dt,
+            "run": sorted(REQUIRED_STREAMS_RUN),
+            "other": sorted(REQUIRED_STREAMS_OTHER),
+        },
+        binary=True,
+    )
+    return {row[0] for row in cur.fetchall()}
 
-    if r.status_code != 200:
-        raise RuntimeError(f"Streams fetch failed (HTTP {r.status_code}): {r.text}")
 
-    return r.json()
+UPSERT_ACTIVITY_SQL = """
+    INSERT INTO aura_strava.activities (
+      activity_id, athlete_id, name, sport_type,
+      start_date_utc, start_date_local, timezone,
+      distance_m, moving_time_s, elapsed_time_s,
+      total_elevation_gain_m,
+      start_lat, start_lng, end_lat, end_lng,
+      raw, ingested_at_utc
+    )
+    VALUES (
+      %(id)s, %(athlete_id)s, %(name)s, %(sport_type)s,
+      %(start_date)s, %(start_date_local)s, %(timezone)s,
+      %(distance)s, %(moving_time)s, %(elapsed_time)s,
+      %(total_elevation_gain)s,
+      %(slat)s, %(slng)s, %(elat)s, %(elng)s,
+      %(raw)s, NOW()
+    )
+    ON CONFLICT (activity_id) DO UPDATE
+      SET raw=EXCLUDED.raw,
+          ingested_at_utc=NOW();
+"""
+
+CREATE_STREAM_STAGING_SQL = """
+    CREATE TEMP TABLE IF NOT EXISTS _stg_streams (
+      activity_id   BIGINT NOT NULL,
+      stream_type   TEXT NOT NULL,
+      original_size INTEGER,
+      raw           JSONB NOT NULL
+    )
+    ON COMMIT DELETE ROWS;
+"""
+
+# Only raw is shipped; data is its "data" member, extracted server-side so the
+# (large) sample array crosses the wire and gets serialized once.
+COPY_STREAM_STAGING_SQL = """
+    COPY _stg_streams (activity_id, stream_type, original_size, raw)
+    FROM STDIN
+"""
+
+# Fixed-type streams are stored as native arrays (columns from migration 002,
+# which must be applied before this version runs) instead of a second JSONB copy
+# in `data`; `data` is only filled for stream types not listed here. The arrays
+# are unpacked from raw server-side so the payload still crosses the wire once;
+# "latlng" becomes an N x 2 double precision array. raw stays as the archive.
+STREAM_ARRAY_TYPES = {
+    "int": ["time", "heartrate", "cadence", "watts", "temp"],
+    "float": ["distance", "velocity_smooth", "altitude", "grade_smooth"],
+    "bool": ["moving"],
+    "latlng": ["latlng"],
+}
 
+MERGE_STREAM_STAGING_SQL = """
+    INSERT INTO aura_strava.activity_streams (
+      activity_id, stream_type, original_size, data,
+      data_int, data_float, data_bool, data_latlng,
+      raw, ingested_at_utc
+    )
+    SELECT
+      activity_id, stream_type, original_size,
+      CASE WHEN stream_type = ANY(
+        %(int)s::text[] || %(float)s::text[] || %(bool)s::text[] || %(latlng)s::text[]
+      ) THEN NULL ELSE raw->'data' END,
+      CASE WHEN stream_type = ANY(%(int)s::text[]) THEN ARRAY(
+        SELECT e::numeric::integer
+        FROM jsonb_array_elements_text(raw->'data') WITH ORDINALITY AS t(e, i) ORDER BY i
+      ) END,
+      CASE WHEN stream_type = ANY(%(float)s::text[]) THEN ARRAY(
+        SELECT e::real
+        FROM jsonb_array_elements_text(raw->'data') WITH ORDINALITY AS t(e, i) ORDER BY i
+      ) END,
+      CASE WHEN stream_type = ANY(%(bool)s::text[]) THEN ARRAY(
+        SELECT e::boolean
+        FROM jsonb_array_elements_text(raw->'data') WITH ORDINALITY AS t(e, i) ORDER BY i
+      ) END,
+      CASE WHEN stream_type = ANY(%(latlng)s::text[]) THEN ARRAY(
+        SELECT ARRAY[(e->>0)::double precision, (e->>1)::double precision]
+        FROM jsonb_array_elements(raw->'data') WITH ORDINALITY AS t(e, i) ORDER BY i
+      ) END,
+      raw, NOW()
+    FROM _stg_streams
+    ON CONFLICT (activity_id, stream_type) DO UPDATE
+      SET original_size=EXCLUDED.original_size,
+          data=EXCLUDED.data,
+          data_int=EXCLUDED.data_int,
+          data_float=EXCLUDED.data_float,
+          data_bool=EXCLUDED.data_bool,
+          data_latlng=EXCLUDED.data_latlng,
+          raw=EXCLUDED.raw,
+          ingested_at_utc=NOW();
+"""
+
+
+def activity_params(a: Activity) -> dict[str, Any]:
+    slat, slng = a.get("start_latlng") or NO_LATLNG
+    elat, elng = a.get("end_latlng") or NO_LATLNG
+    athlete = a.get("athlete")
+
+    return {
+        "id": a["id"],
+        "athlete_id": athlete.get("id") if athlete else None,
+        "name": a.get("name"),
+        "sport_type": a.get("sport_type") or a.get("type"),
+        "start_date": a.get("start_date"),
+        "start_date_local": a.get("start_date_local"),
+        "timezone": a.get("timezone"),
+        "distance": a.get("distance"),
+        "moving_time": a.get("moving_time"),
+        "elapsed_time": a.get("elapsed_time"),
+        "total_elevation_gain": a.get("total_elevation_gain"),
+        "slat": slat,
+        "slng": slng,
+        "elat": elat,
+        "elng": elng,
+        "raw": Jsonb(a),
+    }
 
-def db_latest_activity_start(conn):
-    with conn.cursor() as cur:
-        cur.execute("SELECT MAX(start_date_utc) FROM aura_strava.activities;")
-        return cur.fetchone()[0]
 
+def stream_row(activity_id: int, stype: str, sobj: dict[str, Any]) -> StreamRow:
+    return (
+        activity_id,
+        stype,
+        sobj.get("original_size"),
+        Jsonb(sobj),
+    )
 
-def activity_has_required_streams(conn, activity_id: int, required: set[str]) -> bool:
-    with conn.cursor() as cur:
-        cur.execute(
-            """
-            SELECT stream_type
-            FROM aura_strava.activity_streams
-            WHERE activity_id=%s;
-            """,
-            (activity_id,),
-        )
-        present = {row[0] for row in cur.fetchall()}
 
-    return required.issubset(present)
+def create_stream_staging(cur: psycopg.Cursor) -> None:
+    cur.execute(CREATE_STREAM_STAGING_SQL)
 
 
+def flush_batch(
+    cur: psycopg.Cursor,
+    activity_rows: list[dict[str, Any]],
+    stream_rows: list[StreamRow],
+) -> None:
+    """
+    Send buffered upserts in bulk and commit, in two round-trips.
 
-def upsert_activity(conn, a: dict) -> None:
-    start_latlng = a.get("start_latlng") or [None, None]
-    end_latlng = a.get("end_latlng") or [None, None]
+    Streams are COPY'd into the _stg_streams temp table first (COPY is not
+    allowed in pipeline mode; staging has no FK, so order doesn't matter yet).
+    Then one pipeline carries the activity executemany, the INSERT ... SELECT
+    merge from staging and the COMMIT: parents land before their streams and
+    the server sees all of it before we wait. Staging rows vanish on commit.
+    """
+    if not activity_rows and not stream_rows:
+        return
 
-    with conn.cursor() as cur:
-        cur.execute(
-            """
-            INSERT INTO aura_strava.activities (
-              activity_id, athlete_id, name, sport_type,
-              start_date_utc, start_date_local, timezone,
-              distance_m, moving_time_s, elapsed_time_s,
-              total_elevation_gain_m,
-              start_lat, start_lng, end_lat, end_lng,
-              raw, ingested_at_utc
-            )
-            VALUES (
-              %(id)s, %(athlete_id)s, %(name)s, %(sport_type)s,
-              %(start_date)s, %(start_date_local)s, %(timezone)s,
-              %(distance)s, %(moving_time)s, %(elapsed_time)s,
-              %(total_elevation_gain)s,
-              %(slat)s, %(slng)s, %(elat)s, %(elng)s,
-              %(raw)s::jsonb, NOW()
-            )
-            ON CONFLICT (activity_id) DO UPDATE
-              SET raw=EXCLUDED.raw,
-                  ingested_at_utc=NOW();
-            """,
-            {
-                "id": a["id"],
-                "athlete_id": a.get("athlete", {}).get("id"),
-                "name": a.get("name"),
-                "sport_type": a.get("sport_type") or a.get("type"),
-                "start_date": a.get("start_date"),
-                "start_date_local": a.get("start_date_local"),
-                "timezone": a.get("timezone"),
-                "distance": a.get("distance"),
-                "moving_time": a.get("moving_time"),
-                "elapsed_time": a.get("elapsed_time"),
-                "total_elevation_gain": a.get("total_elevation_gain"),
-                "slat": start_latlng[0],
-                "slng": start_latlng[1],
-                "elat": end_latlng[0],
-                "elng": end_latlng[1],
-                "raw": json.dumps(a),
-            },
-        )
-
-
-def upsert_stream(conn, activity_id: int, stype: str, sobj: dict) -> None:
-    with conn.cursor() as cur:
-        cur.execute(
-            """
-            INSERT INTO aura_strava.activity_streams (
-              activity_id, stream_type, original_size, data, raw, ingested_at_utc
-            )
-            VALUES (%s,%s,%s,%s::jsonb,%s::jsonb,NOW())
-            ON CONFLICT (activity_id, stream_type) DO UPDATE
-              SET data=EXCLUDED.data,
-                  raw=EXCLUDED.raw,
-                  ingested_at_utc=NOW();
-            """,
-            (
-                activity_id,
-                stype,
-                sobj.get("original_size"),
-                json.dumps(sobj.get("data")),
-                json.dumps(sobj),
-            ),
-        )
-
-
-def main():
-    print("=== Strava Incremental Ingester ===")
+    conn = cur.connection
 
-    token = refresh_access_token()
-    print("✅ Token refreshed")
+    if stream_rows:
+        with cur.copy(COPY_STREAM_STAGING_SQL) as cp:
+            for row in stream_rows:
+                cp.write_row(row)
 
-    activities = 0
-    streams = 0
-    skipped = 0
+    with conn.pipeline():
+        if activity_rows:
+            cur.executemany(UPSERT_ACTIVITY_SQL, activity_rows)
+        if stream_rows:
+            cur.execute(MERGE_STREAM_STAGING_SQL, STREAM_ARRAY_TYPES)
+        conn.commit()
 
-    with psycopg.connect(AURA_DATABASE_URL) as conn:
-        latest = db_latest_activity_start(conn)
-        if latest:
-            after_dt = latest - timedelta(hours=LOOKBACK_BUFFER_HOURS)
-        else:
-            after_dt = utc_now() - timedelta(days=DEFAULT_DAYS_IF_EMPTY)
+    activity_rows.clear()
+    stream_rows.clear()
 
-        print(f"Fetching activities after {after_dt.isoformat()}")
-        after_epoch = to_epoch(after_dt)
 
-        for a in fetch_activities(token, after_epoch):
-            upsert_activity(conn, a)
-            activities += 1
+async def ingest(
+    cur: psycopg.Cursor,
+    after_epoch: int,
+    completed: set[int],
+) -> tuple[int, int, int]:
+    activities = 0
+    streams = 0
+    skipped = 0
 
-            sport = (a.get("sport_type") or a.get("type") or "").lower()
+    sem = asyncio.Semaphore(MAX_CONCURRENT_REQUESTS)
+    limiter = RateLimiter()
+    connector = aiohttp.TCPConnector(limit=64, limit_per_host=16)
+
+    # One session for the whole run (token refresh included): every call to
+    # www.strava.com reuses pooled keep-alive connections instead of a fresh TLS handshake.
+    async with aiohttp.ClientSession(
+        connector=connector,
+        timeout=aiohttp.ClientTimeout(total=HTTP_TIMEOUT_S),
+    ) as session:
+        token = await refresh_access_token(session)
+        print("✅ Token refreshed")
+
+        async def bounded_fetch_streams(activity_id: int) -> tuple[int, dict[str, Any]]:
+            async with sem:
+                return activity_id, await fetch_streams(session, limiter, token, activity_id)
+
+        page_no = 1
+        fetched = 0
+
+        while True:
+            page = await fetch_activities(session, limiter, token, after_epoch, page_no)
+            if not page:
+                break
+
+            if MAX_ACTIVITIES_PER_RUN:
+                page = page[: MAX_ACTIVITIES_PER_RUN - fetched]
+            fetched += len(page)
+
+            activity_rows: list[dict[str, Any]] = []
+            stream_rows: list[StreamRow] = []
+            pending: dict[int, Activity] = {}
+
+            for a in page:
+                if a["id"] in completed:
+                    skipped += 1
+                else:
+                    pending[a["id"]] = a
+
+            # Fetch the whole page's streams at once: the semaphore keeps
+            # MAX_CONCURRENT_REQUESTS in flight and we store results as they land
+            # instead of idling on the slowest request of every batch.
+            #
+            # Results are committed oldest-first, and an activity only joins a batch
+            # together with its streams. The next run's lookback starts from
+            # MAX(start_date_utc), so a committed activity must never be newer than
+            # one whose fetch could still fail (Strava returns `after` queries
+            # oldest-first, so pages are already in that order).
+            order = sorted(pending, key=lambda aid: pending[aid]["start_date"])
+            results: dict[int, dict[str, Any]] = {}
+            next_i = 0
+
+            tasks = [asyncio.create_task(bounded_fetch_streams(aid)) for aid in order]
+            try:
+                for fut in asyncio.as_completed(tasks):
+                    activity_id, streams_by_type = await fut
+                    results[activity_id] = streams_by_type
+
+                    while next_i < len(order) and order[next_i] in results:
+                        aid = order[next_i]
+                        next_i += 1
+                        activity_rows.append(activity_params(pending[aid]))
+                        activities += 1
+                        for stype, sobj in results.pop(aid).items():
+                            stream_rows.append(stream_row(aid, stype, sobj))
+                            streams += 1
+
+                        if len(activity_rows) >= COMMIT_EVERY_N_ACTIVITIES:
+                            # psycopg I/O is blocking: run it off the event loop so the
+                            # in-flight fetches keep reading (and their timeouts stay honest)
+                            await asyncio.to_thread(flush_batch, cur, activity_rows, stream_rows)
+                            print(f"... {activities} activities | {streams} streams | {skipped} skipped")
+            finally:
+                # On failure, stop the page's in-flight fetches before the session closes
+                for task in tasks:
+                    task.cancel()
+                await asyncio.gather(*tasks, return_exceptions=True)
+
+            await asyncio.to_thread(flush_batch, cur, activity_rows, stream_rows)
+            print(f"... {activities} activities | {streams} streams | {skipped} skipped")
 
-        if sport == "run":
-            required = REQUIRED_STREAMS_RUN
-        else:
-            # Keep it cheap for non-runs; you can expand later if you want
-            required = {"time"}
+            if MAX_ACTIVITIES_PER_RUN and fetched >= MAX_ACTIVITIES_PER_RUN:
+                break
+            page_no += 1
 
-        if activity_has_required_streams(conn, a["id"], required):
-            skipped += 1
-        else:
-            streams_by_type = fetch_streams(token, a["id"])
-            for stype, sobj in streams_by_type.items():
-                upsert_stream(conn, a["id"], stype, sobj)
-                streams += 1
-            time.sleep(SLEEP_BETWEEN_CALLS_S)
+    return activities, streams, skipped
 
 
-            if activities % COMMIT_EVERY_N_ACTIVITIES == 0:
-                conn.commit()
-                print(f"... {activities} activities | {streams} streams | {skipped} skipped")
+def main() -> None:
+    print("=== Strava Incremental Ingester ===")
 
-        conn.commit()
+    # prepare_threshold=1: the upserts are server-side prepared from their second
+    # execution on, so later batches skip Parse/Describe.
+    with psycopg.connect(AURA_DATABASE_URL, prepare_threshold=1) as conn:
+        conn.autocommit = False  # flush_batch() owns the transaction boundaries
+        # Jsonb params serialize via orjson (bytes, no str detour). Must run before
+        # conn.cursor(): a cursor copies the connection's adapters when it is created.
+        set_json_dumps(orjson.dumps, conn)
+        with conn.cursor() as cur:
+            create_stream_staging(cur)
+            latest = db_latest_activity_start(cur)
+            if latest:
+                after_dt = latest - timedelta(hours=LOOKBACK_BUFFER_HOURS)
+            else:
+                after_dt = utc_now() - timedelta(days=DEFAULT_DAYS_IF_EMPTY)
+
+            print(f"Fetching activities after {after_dt.isoformat()}")
+            after_epoch = to_epoch(after_dt)
+            completed = db_completed_activity_ids(cur, after_dt)
+
+            activities, streams, skipped = asyncio.run(ingest(cur, after_epoch, completed))
 
     print("✅ Incremental ingest complete")
     print(f"Activities processed: {activities}")